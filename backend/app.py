@@ -1,11 +1,13 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, RedirectResponse
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional, Set, Union
+import asyncio
 import random
 from prompts import PROMPT_LIBRARY
 from llm_utils import Agent, remove_preamble
+from trace_utils import TraceMiddleware, instrument_agent
 import uvicorn
 import json
 import os
@@ -34,6 +36,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in trace capture / replay (see trace_utils.py); a pass-through unless configured
+app.add_middleware(TraceMiddleware)
+
 WRITING_TYPES = [
     {
         "id": "poem",
@@ -56,6 +61,10 @@ evaluator = Agent('gpt41mini', PROMPT_LIBRARY['evaluator'], history=True, json_m
 badge_creator = Agent('gemini', PROMPT_LIBRARY['badger'], json_mode=True)
 hint_generator = Agent('gpt41nano', PROMPT_LIBRARY['hinter'])
 
+instrument_agent(evaluator, 'evaluator')
+instrument_agent(badge_creator, 'badge_creator')
+instrument_agent(hint_generator, 'hint_generator')
+
 class SubmissionRequest(BaseModel):
     submission: str
     badges: List[dict]
@@ -92,22 +101,33 @@ async def generate_badges(writing_type_id: str):
         })
     return JSONResponse(content={"badges": badges})
 
-@app.post("/evaluate")
-async def evaluate(request: SubmissionRequest):
+def _evaluation_prompt(submission: str, badges: List[dict], writing_type: dict) -> str:
     criteria_text = "\n".join([
         f"Badge {i+1} ({badge['name']}): {badge['criteria']}" 
-        for i, badge in enumerate(request.badges)
+        for i, badge in enumerate(badges)
     ])
     
-    prompt = f"""
-    Writing Task: {request.writingType['prompt']} ({request.writingType['description']})
+    return f"""
+    Writing Task: {writing_type['prompt']} ({writing_type['description']})
     
     Submission:
-    {request.submission}
+    {submission}
     
     Evaluate if this submission earns these badges:
     {criteria_text}
     """
+
+def _hint_prompt(submission: str, badges: List[dict], writing_type: dict) -> str:
+    return f"""
+    Writing Task: {writing_type['prompt']} ({writing_type['description']})
+    
+    Current submission: {submission}
+    Unmet criteria: {', '.join([badge['name'] for badge in badges])}
+    """
+
+@app.post("/evaluate")
+async def evaluate(request: SubmissionRequest):
+    prompt = _evaluation_prompt(request.submission, request.badges, request.writingType)
     
     response = await evaluator.respond_to(prompt)
     response = json.loads(response)
@@ -118,15 +138,193 @@ async def evaluate(request: SubmissionRequest):
 
 @app.post("/get-hint")
 async def get_hint(request: SubmissionRequest):
-    prompt = f"""
-    Writing Task: {request.writingType['prompt']} ({request.writingType['description']})
-    
-    Current submission: {request.submission}
-    Unmet criteria: {', '.join([badge['name'] for badge in request.badges])}
-    """
+    prompt = _hint_prompt(request.submission, request.badges, request.writingType)
     response = await hint_generator.respond_to(prompt)
     return JSONResponse(content={"hint": response})
 
+# --- WebSocket game channel: per-connection state and text deltas ---
+class GameBadge(BaseModel):
+    id: str
+    name: str
+    criteria: str
+
+class GameWritingType(BaseModel):
+    prompt: str
+    description: str
+
+class StartMessage(BaseModel):
+    writingType: GameWritingType
+    badges: List[GameBadge]
+    text: str = ""
+    rev: int = 0
+
+class DeltaMessage(BaseModel):
+    rev: int
+    offset: int
+    remove: int = 0
+    insert: str = ""
+
+class TextMessage(BaseModel):
+    rev: int
+    text: str
+
+class SubmitMessage(BaseModel):
+    rev: Optional[int] = None
+    requestId: Optional[Union[int, str]] = None
+
+class HintMessage(BaseModel):
+    requestId: Optional[Union[int, str]] = None
+    badgeIds: Optional[List[str]] = None
+
+GAME_MESSAGES = {
+    "start": StartMessage,
+    "delta": DeltaMessage,
+    "text": TextMessage,
+    "submit": SubmitMessage,
+    "hint": HintMessage,
+}
+
+class GameSession:
+    """State for one /ws/game connection.
+
+    The client sends the writing type and badges once, then only text deltas,
+    so submits and hints carry no payload. Both run as tasks against the text
+    as it was when the request arrived, so typing can continue meanwhile.
+    Error replies name the request they belong to (``for`` and ``requestId``).
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.writing_type: dict = {}
+        self.badges: List[dict] = []
+        self.scores: dict = {}
+        self.text = ""
+        self.rev = 0
+        self.evaluator: Optional[Agent] = None
+        self._send_lock = asyncio.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def send(self, message: dict):
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    async def send_error(self, kind: Optional[str], message: str, request_id=None):
+        await self.send({"type": "error", "for": kind, "requestId": request_id, "message": message})
+
+    async def handle(self, raw: str):
+        try:
+            message = json.loads(raw)
+            kind = message.get("type")
+            model = GAME_MESSAGES.get(kind)
+        except (ValueError, AttributeError, TypeError):
+            await self.send_error(None, "Messages must be JSON objects with a string 'type'")
+            return
+        if model is None:
+            await self.send_error(None, f"Unknown message type: {kind}")
+            return
+        try:
+            message = model(**message)
+        except ValidationError as e:
+            await self.send_error(kind, f"Invalid '{kind}' message: {e}", _raw_request_id(message))
+            return
+
+        if kind == "start":
+            self._start(message)
+        elif kind == "delta":
+            await self._apply_delta(message)
+        elif kind == "text":
+            self.text = message.text
+            self.rev = message.rev
+        elif self.evaluator is None:
+            await self.send_error(kind, "Send a 'start' message first", message.requestId)
+        elif kind == "submit":
+            if message.rev is not None and message.rev != self.rev:
+                # The client is scoring a revision we don't have; it resends the text and submits again
+                await self.send({"type": "resync", "rev": self.rev, "for": "submit", "requestId": message.requestId})
+                return
+            self._spawn(kind, message.requestId, self._submit(self.text, self.rev, message.requestId))
+        elif kind == "hint":
+            self._spawn(kind, message.requestId, self._hint(self.text, message))
+
+    def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+    def _start(self, message: StartMessage):
+        self.writing_type = dict(message.writingType)
+        self.badges = [dict(badge) for badge in message.badges]
+        self.scores = {}
+        self.text = message.text
+        self.rev = message.rev
+        # Each game keeps its own evaluation history (see "submission history" in the evaluator prompt)
+        self.evaluator = instrument_agent(
+            Agent('gpt41mini', PROMPT_LIBRARY['evaluator'], history=True, json_mode=True), 'evaluator'
+        )
+
+    async def _apply_delta(self, message: DeltaMessage):
+        end = message.offset + message.remove
+        if message.rev != self.rev + 1 or message.offset < 0 or message.remove < 0 or end > len(self.text):
+            # Missed, reordered or out-of-range delta: ask the client for the full text
+            await self.send({"type": "resync", "rev": self.rev})
+            return
+        self.text = self.text[:message.offset] + message.insert + self.text[end:]
+        self.rev = message.rev
+
+    async def _submit(self, text: str, rev: int, request_id):
+        prompt = _evaluation_prompt(text, self.badges, self.writing_type)
+        result = json.loads(await self.evaluator.respond_to(prompt))
+        self.scores = result
+        await self.send({"type": "scores", "rev": rev, "requestId": request_id, "result": result})
+
+    async def _hint(self, text: str, message: HintMessage):
+        if message.badgeIds:
+            badges = [b for b in self.badges if b["id"] in message.badgeIds]
+        else:
+            badges = [
+                b for i, b in enumerate(self.badges)
+                if int(self.scores.get(f"badge_{i+1}", {}).get("earned", 0)) != 2
+            ]
+        response = await hint_generator.respond_to(_hint_prompt(text, badges, self.writing_type))
+        await self.send({"type": "hint", "requestId": message.requestId, "hint": response})
+
+    def _spawn(self, kind: str, request_id, coro) -> asyncio.Task:
+        task = asyncio.create_task(self._report_errors(kind, request_id, coro))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        # A task cancelled before it first runs never starts *coro*; close it to avoid the warning
+        task.add_done_callback(lambda _: coro.close())
+        return task
+
+    async def _report_errors(self, kind: str, request_id, coro):
+        try:
+            await coro
+        except asyncio.CancelledError:
+            raise
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            print(f"[WS] Game channel {kind} failed: {e}")
+            try:
+                await self.send_error(kind, str(e), request_id)
+            except Exception:
+                pass
+
+def _raw_request_id(message: dict):
+    request_id = message.get("requestId")
+    return request_id if isinstance(request_id, (int, str)) else None
+
+@app.websocket("/ws/game")
+async def game_channel(websocket: WebSocket):
+    await websocket.accept()
+    session = GameSession(websocket)
+    try:
+        while True:
+            await session.handle(await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.close()
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok", "env": os.environ.get('RAILWAY_ENVIRONMENT', 'local')}
@@ -0,0 +1,286 @@
+# Replay a captured request trace against the app and report latency/throughput
+# LLM responses are served from the trace (see trace_utils.py), so runs are
+# deterministic and free; differences between builds come from our own code.
+#
+# Usage:
+#   python replay_trace.py traces/requests.jsonl.gz                  # in-process, recorded pacing
+#   python replay_trace.py traces/requests.jsonl.gz --speed 10       # 10x faster than recorded
+#   python replay_trace.py traces/requests.jsonl.gz --speed 0        # as fast as possible
+#   python replay_trace.py traces/requests.jsonl.gz --out new.json --compare old.json
+#   python replay_trace.py traces/requests.jsonl.gz --url http://localhost:8000
+#       (the server must be started with TRACE_REPLAY_PATH pointing at the same trace)
+#
+# In-process runs start the app on a local port so /ws/game connections replay
+# too; their submit and hint round trips are reported as "/ws/game submit|hint".
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+import websockets
+
+from trace_utils import TRACE_ID_HEADER, TRACE_ID_PARAM, load_trace, restore_truncated, trace_files
+
+WEBSOCKET_REPLY_TIMEOUT_SECONDS = 60  # how long to wait for outstanding replies before closing
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _summarize(latencies: List[float], errors: int) -> Dict[str, float]:
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "mean_ms": round(statistics.mean(latencies), 2) if latencies else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2) if latencies else 0.0,
+    }
+
+
+async def _send(client: httpx.AsyncClient, record: dict) -> httpx.Response:
+    url = record["path"]
+    if record.get("query"):
+        url = f"{url}?{record['query']}"
+    headers = {TRACE_ID_HEADER: record["id"]}
+    if record["method"] == "GET":
+        return await client.get(url, headers=headers)
+    return await client.request(record["method"], url, json=restore_truncated(record.get("body")), headers=headers)
+
+
+def _websocket_latencies(path: str, events: List[dict]) -> Tuple[List[Tuple[str, float]], int]:
+    """Pair submits and hints with their replies; returns (label, ms) pairs and the error count."""
+    pending_submits: List[float] = []
+    pending_hints: Dict[object, float] = {}
+    latencies: List[Tuple[str, float]] = []
+    errors = 0
+    for event in events:
+        if isinstance(event.get("in"), dict):
+            kind = event["in"].get("type")
+            if kind == "submit":
+                pending_submits.append(event["t"])
+            elif kind == "hint":
+                pending_hints[event["in"].get("requestId")] = event["t"]
+        elif isinstance(event.get("out"), dict):
+            reply = event["out"]
+            if reply.get("type") == "scores" and pending_submits:
+                latencies.append((f"{path} submit", event["t"] - pending_submits.pop(0)))
+            elif reply.get("type") == "hint" and reply.get("requestId") in pending_hints:
+                latencies.append((f"{path} hint", event["t"] - pending_hints.pop(reply["requestId"])))
+            elif reply.get("type") == "error":
+                errors += 1
+    return latencies, errors
+
+
+async def _replay_websocket(base_url: str, record: dict, speed: float) -> Tuple[List[Tuple[str, float]], int]:
+    """Replay one captured connection's client messages and time the replies."""
+    url = f"{base_url.replace('http', 'ws', 1).rstrip('/')}{record['path']}?{TRACE_ID_PARAM}={record['id']}"
+    sent = [e["in"] for e in record["events"] if "in" in e]
+    expected = sum(1 for m in sent if isinstance(m, dict) and m.get("type") in ("submit", "hint"))
+    # Error replies the server also sent while capturing (e.g. to malformed messages) are not failures
+    recorded_errors = _websocket_latencies(record["path"], record["events"])[1]
+    events: List[dict] = []
+    start = time.perf_counter()
+
+    def now() -> float:
+        return (time.perf_counter() - start) * 1000
+
+    async with websockets.connect(url) as ws:
+        async def read():
+            async for raw in ws:
+                events.append({"t": now(), "out": json.loads(raw)})
+
+        reader = asyncio.create_task(read())
+        for event in record["events"]:
+            if "in" not in event:
+                continue
+            if speed > 0:
+                delay = event["t"] / 1000 / speed - now() / 1000
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            message = restore_truncated(event["in"])
+            events.append({"t": now(), "in": message})
+            await ws.send(json.dumps(message))
+
+        deadline = time.perf_counter() + WEBSOCKET_REPLY_TIMEOUT_SECONDS
+        while time.perf_counter() < deadline and not reader.done():
+            latencies, errors = _websocket_latencies(record["path"], events)
+            if len(latencies) + max(0, errors - recorded_errors) >= expected:
+                break
+            await asyncio.sleep(0.01)
+        reader.cancel()
+
+    latencies, errors = _websocket_latencies(record["path"], events)
+    new_errors = max(0, errors - recorded_errors)
+    return latencies, new_errors + max(0, expected - len(latencies) - new_errors)
+
+
+async def replay(records: List[dict], client: httpx.AsyncClient, speed: float, concurrency: int) -> dict:
+    """Fire *records* at *client*, paced by their recorded timestamps divided by *speed*.
+
+    WebSocket records connect to ``client.base_url``, so they need a real server.
+    """
+    semaphore = asyncio.Semaphore(concurrency) if speed <= 0 else None
+    results: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    first_ts = records[0]["ts"] if records else 0.0
+    start = time.perf_counter()
+
+    async def run(record: dict):
+        if speed > 0:
+            delay = (record["ts"] - first_ts) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            await semaphore.acquire()
+        path = record["path"]
+        try:
+            if record["method"] == "WEBSOCKET":
+                await run_websocket(record)
+            else:
+                await run_http(record)
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    async def run_http(record: dict):
+        path = record["path"]
+        sent = time.perf_counter()
+        try:
+            response = await _send(client, record)
+            failed = response.status_code != record.get("status", 200)
+        except Exception as e:
+            print(f"[REPLAY] {path} ({record['id']}) failed: {e}")
+            failed = True
+        results.setdefault(path, []).append((time.perf_counter() - sent) * 1000)
+        if failed:
+            errors[path] = errors.get(path, 0) + 1
+
+    async def run_websocket(record: dict):
+        path = record["path"]
+        try:
+            latencies, failures = await _replay_websocket(str(client.base_url), record, speed)
+        except Exception as e:
+            # A dropped connection has no round trips to time; count it as one error
+            print(f"[REPLAY] {path} ({record['id']}) failed: {e}")
+            latencies, failures = [], 1
+        for label, ms in latencies:
+            results.setdefault(label, []).append(ms)
+        if failures:
+            errors[path] = errors.get(path, 0) + failures
+
+    await asyncio.gather(*(run(r) for r in records))
+    wall = time.perf_counter() - start
+
+    all_latencies = [ms for values in results.values() for ms in values]
+    recorded: Dict[str, List[float]] = {}
+    for record in records:
+        if record["method"] == "WEBSOCKET":
+            for label, ms in _websocket_latencies(record["path"], record["events"])[0]:
+                recorded.setdefault(label, []).append(ms)
+        else:
+            recorded.setdefault(record["path"], []).append(record["ms"])
+    # Throughput counts timed round trips (HTTP requests plus WebSocket submits and hints),
+    # the same unit as overall.count, rather than trace records
+    return {
+        "records": len(records),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(all_latencies) / wall, 2) if wall > 0 else 0.0,
+        "overall": _summarize(all_latencies, sum(errors.values())),
+        "endpoints": {
+            path: _summarize(results.get(path, []), errors.get(path, 0))
+            for path in sorted(set(results) | set(errors))
+        },
+        "recorded": {path: _summarize(values, 0) for path, values in sorted(recorded.items())},
+    }
+
+
+def _print_report(report: dict, baseline: Optional[dict]):
+    print(f"Replayed {report['records']} trace records ({report['overall']['count']} round trips) "
+          f"in {report['wall_s']}s ({report['throughput_rps']} req/s)")
+    if baseline:
+        print(f"  baseline: {baseline['overall']['count']} round trips in {baseline['wall_s']}s "
+              f"({baseline['throughput_rps']} req/s)")
+    rows = [("overall", report["overall"])] + list(report["endpoints"].items())
+    for name, stats in rows:
+        line = (f"  {name:<18} n={stats['count']:<5} err={stats['errors']:<3} "
+                f"p50={stats['p50_ms']:>9.2f}ms p95={stats['p95_ms']:>9.2f}ms p99={stats['p99_ms']:>9.2f}ms")
+        base = baseline and (baseline["overall"] if name == "overall" else baseline["endpoints"].get(name))
+        if base and base["p50_ms"]:
+            delta = (stats["p50_ms"] - base["p50_ms"]) / base["p50_ms"] * 100
+            line += f"  (p50 {delta:+.1f}% vs baseline)"
+        print(line)
+
+
+async def _serve_in_process(trace: str):
+    """Start the app on a free local port, serving LLM responses from *trace*."""
+    # Must be set before importing the app so its middleware loads the trace
+    os.environ["TRACE_REPLAY_PATH"] = trace
+    os.environ.pop("TRACE_CAPTURE_PATH", None)
+    from app import app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()  # surface the startup error
+        await asyncio.sleep(0.05)
+    return server, serving, f"http://127.0.0.1:{port}"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replay a captured request trace.")
+    parser.add_argument("trace", help="Trace file written via TRACE_CAPTURE_PATH (rotated siblings are included)")
+    parser.add_argument("--url", help="Replay against a running server instead of in-process")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Pacing multiplier: 1 = recorded, 10 = ten times faster, 0 = no pacing")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max in-flight requests when --speed 0")
+    parser.add_argument("--out", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    args = parser.parse_args()
+
+    records = sorted(load_trace(trace_files(args.trace)), key=lambda r: r["ts"])
+    if not records:
+        raise SystemExit(f"No trace records found at {args.trace}")
+
+    server = None
+    url = args.url
+    if not url:
+        server, serving, url = await _serve_in_process(args.trace)
+
+    try:
+        async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+            report = await replay(records, client, args.speed, max(1, args.concurrency))
+    finally:
+        if server is not None:
+            server.should_exit = True
+            await serving
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    _print_report(report, baseline)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,488 @@
+# Opt-in request trace capture and deterministic replay
+# Records sanitized request bodies, timings and LLM responses for the game
+# endpoints to a rotating compact JSONL (optionally gzip) log, and can serve
+# those LLM responses back so a captured trace replays without provider calls.
+#
+# Enable capture:  TRACE_CAPTURE_PATH=traces/requests.jsonl.gz
+# Enable replay:   TRACE_REPLAY_PATH=traces/requests.jsonl.gz (see replay_trace.py)
+
+import asyncio
+import atexit
+import contextvars
+import glob
+import gzip
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs
+from uuid import uuid4
+
+__all__ = [
+    "TRACED_PATHS",
+    "TRACED_WEBSOCKETS",
+    "TRACE_ID_HEADER",
+    "TraceWriter",
+    "TraceMiddleware",
+    "instrument_agent",
+    "load_trace",
+    "restore_truncated",
+    "trace_files",
+]
+
+# ------------------------------------------------------------
+# Configuration
+# ------------------------------------------------------------
+
+# Endpoints worth capturing: everything that drives an LLM call or a share card
+TRACED_PATHS = ("/generate-badges", "/evaluate", "/get-hint", "/share-image")
+# WebSocket endpoints; each connection is captured as one record of timed messages
+TRACED_WEBSOCKETS = ("/ws/game",)
+
+# Header (or, for WebSockets, query parameter) the replay tool uses to tell the
+# server which trace record it is replaying
+TRACE_ID_HEADER = "x-trace-id"
+TRACE_ID_PARAM = "trace_id"
+
+_DEFAULT_MAX_BYTES = 20 * 1024 * 1024  # rotate once a file reaches ~20MB on disk
+_DEFAULT_BACKUPS = 5
+_DEFAULT_MAX_FIELD_CHARS = 4000  # longer strings are truncated before logging
+_DEFAULT_FLUSH_INTERVAL = 0.5  # seconds the writer thread batches records for
+
+# Per-request list of LLM calls; populated by instrumented agents
+_llm_calls: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("trace_llm_calls", default=None)
+# Per-request queues of recorded LLM calls, keyed by agent, while replaying
+_replay_calls: contextvars.ContextVar[Optional[Dict[str, Deque[dict]]]] = contextvars.ContextVar(
+    "trace_replay_calls", default=None
+)
+# Multiplier on recorded LLM latency while replaying (0 = answer immediately)
+_replay_latency: contextvars.ContextVar[float] = contextvars.ContextVar("trace_replay_latency", default=0.0)
+
+_WORD_CHARS = re.compile(r"\w", re.UNICODE)
+# Marker for a string cut to TRACE_MAX_FIELD_CHARS: {"$truncated": prefix, "length": n}
+_TRUNCATED_KEY = "$truncated"
+# Protocol fields that replay depends on; never masked
+_UNREDACTED_KEYS = {"type", "id", "badgeIds", "requestId"}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default) or default)
+    except ValueError:
+        return default
+
+
+# ------------------------------------------------------------
+# Sanitizing
+# ------------------------------------------------------------
+
+def _sanitize(value, max_chars: int, redact: bool):
+    """Truncate long strings and optionally mask word characters.
+
+    Redaction keeps length and whitespace so replayed prompts and share cards
+    stay realistic in size without logging what players wrote. Truncated
+    strings keep their original length (see ``restore_truncated``) so replay
+    can send requests of the size production saw.
+    """
+    if isinstance(value, str):
+        if redact:
+            value = _WORD_CHARS.sub("x", value)
+        if len(value) > max_chars:
+            return {_TRUNCATED_KEY: value[:max_chars], "length": len(value)}
+        return value
+    if isinstance(value, dict):
+        return {k: _sanitize(v, max_chars, redact and k not in _UNREDACTED_KEYS) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_sanitize(v, max_chars, redact) for v in value]
+    return value
+
+
+# ------------------------------------------------------------
+# Rotating JSONL writer
+# ------------------------------------------------------------
+
+def _rotated_name(path: str, index: int) -> str:
+    """requests.jsonl.gz -> requests.1.jsonl.gz (keeps extensions readable)."""
+    directory, name = os.path.split(path)
+    stem, dot, ext = name.partition(".")
+    rotated = f"{stem}.{index}{dot}{ext}"
+    return os.path.join(directory, rotated)
+
+
+class TraceWriter:
+    """Append-only JSONL writer with size-based rotation.
+
+    ``write`` only enqueues the record; a background thread serializes it and
+    does the disk I/O, so capture adds no file latency to the traced request.
+
+    Args:
+        path: Target file. A ``.gz`` suffix writes gzip-compressed JSONL.
+        max_bytes: Rotate once the file reaches this many bytes on disk.
+        backups: Number of rotated files to keep (``name.1.jsonl`` is newest).
+        flush_interval: Seconds the writer thread waits to batch records
+            before writing them. With ``.gz`` output each batch is appended as
+            one complete gzip member, so the file stays readable while the
+            server runs and at most this much is lost on an unclean shutdown.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = _DEFAULT_MAX_BYTES,
+        backups: int = _DEFAULT_BACKUPS,
+        flush_interval: float = _DEFAULT_FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self._compress = path.endswith(".gz")
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._written = os.path.getsize(path) if os.path.exists(path) else 0
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, record: dict):
+        self._queue.put(record)
+
+    def flush(self):
+        """Block until every record written so far is on disk."""
+        self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            records = [r for r in batch if r is not None]
+            try:
+                if records:
+                    self._write_batch(records)
+            except Exception as e:
+                print(f"[TRACE] Failed to write {len(records)} trace records: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if batch[-1] is None:
+                return
+
+    def _write_batch(self, records: List[dict]):
+        data = b"".join(
+            (json.dumps(r, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8")
+            for r in records
+        )
+        if self._compress:
+            data = gzip.compress(data)
+        if self._written > 0 and self._written + len(data) > self.max_bytes:
+            self._rotate()
+        with open(self.path, "ab") as f:
+            f.write(data)
+        self._written += len(data)
+
+    def _rotate(self):
+        if os.path.exists(self.path):
+            for index in range(self.backups - 1, 0, -1):
+                src = _rotated_name(self.path, index)
+                if os.path.exists(src):
+                    os.replace(src, _rotated_name(self.path, index + 1))
+            if self.backups > 0:
+                os.replace(self.path, _rotated_name(self.path, 1))
+            else:
+                os.remove(self.path)
+        self._written = 0
+
+
+# ------------------------------------------------------------
+# Reading traces
+# ------------------------------------------------------------
+
+def restore_truncated(value):
+    """Undo truncation markers, padding each string back to its recorded length with ``x``."""
+    if isinstance(value, dict):
+        if _TRUNCATED_KEY in value:
+            prefix = value[_TRUNCATED_KEY]
+            return prefix + "x" * max(0, value.get("length", 0) - len(prefix))
+        return {k: restore_truncated(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [restore_truncated(v) for v in value]
+    return value
+
+
+def trace_files(path: str) -> List[str]:
+    """Return *path* plus its rotated siblings, oldest first."""
+    directory, name = os.path.split(path)
+    stem, dot, ext = name.partition(".")
+    pattern = os.path.join(directory, f"{glob.escape(stem)}.*{dot}{glob.escape(ext)}")
+    rotated = []
+    for candidate in glob.glob(pattern):
+        index = os.path.basename(candidate)[len(stem) + 1:].split(".", 1)[0]
+        if index.isdigit():
+            rotated.append((int(index), candidate))
+    files = [p for _, p in sorted(rotated, reverse=True)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def load_trace(paths: List[str]) -> Iterator[dict]:
+    """Yield trace records from the given files (``.gz`` files are decompressed)."""
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line)
+            except (EOFError, json.JSONDecodeError):
+                # Truncated tail from a crashed writer; keep what was complete
+                print(f"[TRACE] Ignoring truncated tail of {path}")
+
+
+# ------------------------------------------------------------
+# Agent instrumentation
+# ------------------------------------------------------------
+
+def instrument_agent(agent, name: str):
+    """Wrap ``agent.respond_to`` so calls are recorded, or served from a trace.
+
+    Outside a traced request the original method runs untouched.
+    """
+    original = agent.respond_to
+
+    async def respond_to(user_input: str) -> str:
+        replay = _replay_calls.get()
+        if replay is not None:
+            return await _replay_call(replay, name, _prompt_key(user_input))
+
+        calls = _llm_calls.get()
+        if calls is None:
+            return await original(user_input)
+
+        call = {"agent": name, "key": _prompt_key(user_input)}
+        start = time.perf_counter()
+        try:
+            response = await original(user_input)
+        except Exception as e:
+            calls.append({**call, "ms": _elapsed_ms(start), "error": str(e)})
+            raise
+        calls.append({**call, "ms": _elapsed_ms(start), "response": response})
+        return response
+
+    agent.respond_to = respond_to
+    return agent
+
+
+def _prompt_key(user_input: str) -> str:
+    """Short hash of the prompt with word characters masked.
+
+    Masking makes the key identical whether or not the trace was redacted, so
+    a replayed prompt built from redacted text still finds its recorded call.
+    """
+    return hashlib.sha1(_WORD_CHARS.sub("x", user_input).encode("utf-8")).hexdigest()[:16]
+
+
+async def _replay_call(replay: Dict[str, Deque[dict]], name: str, key: str) -> str:
+    queue = replay.get(name)
+    if not queue:
+        raise RuntimeError(f"No recorded '{name}' response left in trace for this request")
+    # Prefer the call recorded for this prompt: concurrent submits and hints on one
+    # connection may finish in a different order than they did while capturing.
+    # Fall back to recording order when prompts differ (e.g. a changed template).
+    call = next((c for c in queue if c.get("key") == key), queue[0])
+    queue.remove(call)
+    scale = _replay_latency.get()
+    if scale > 0:
+        await asyncio.sleep(call.get("ms", 0) / 1000 * scale)
+    if "error" in call:
+        raise RuntimeError(call["error"])
+    return call["response"]
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+# ------------------------------------------------------------
+# ASGI middleware
+# ------------------------------------------------------------
+
+class TraceMiddleware:
+    """Pure ASGI middleware that captures and/or replays traced endpoints.
+
+    Capture is enabled by ``TRACE_CAPTURE_PATH``; replay by ``TRACE_REPLAY_PATH``.
+    With neither set the middleware passes requests straight through.
+    Optional knobs: ``TRACE_MAX_BYTES``, ``TRACE_BACKUPS`` and ``TRACE_MAX_FIELD_CHARS``.
+    Request text is masked by default; ``TRACE_REDACT=0`` logs it as sent.
+    LLM responses are never masked, since replay has to serve them back
+    unchanged, and hints and feedback can quote the submission.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.max_field_chars = _env_int("TRACE_MAX_FIELD_CHARS", _DEFAULT_MAX_FIELD_CHARS)
+        self.replay_latency_scale = _env_float("TRACE_REPLAY_LLM_LATENCY", 0.0)
+        self.redact = os.environ.get("TRACE_REDACT", "1").lower() not in ("0", "false", "no")
+
+        capture_path = os.environ.get("TRACE_CAPTURE_PATH")
+        self.writer: Optional[TraceWriter] = None
+        if capture_path:
+            self.writer = TraceWriter(
+                capture_path,
+                max_bytes=_env_int("TRACE_MAX_BYTES", _DEFAULT_MAX_BYTES),
+                backups=_env_int("TRACE_BACKUPS", _DEFAULT_BACKUPS),
+            )
+            print(f"[TRACE] Capturing {', '.join(TRACED_PATHS + TRACED_WEBSOCKETS)} to {capture_path}"
+                  f" ({'redacted' if self.redact else 'UNREDACTED'} request text)")
+
+        replay_path = os.environ.get("TRACE_REPLAY_PATH")
+        self.replay_llm: Optional[Dict[str, List[dict]]] = None
+        if replay_path:
+            records = load_trace(trace_files(replay_path))
+            self.replay_llm = {r["id"]: r.get("llm", []) for r in records}
+            print(f"[TRACE] Serving LLM responses for {len(self.replay_llm)} records from {replay_path}")
+
+    async def __call__(self, scope, receive, send):
+        traced = (
+            (scope["type"] == "http" and scope["path"] in TRACED_PATHS)
+            or (scope["type"] == "websocket" and scope["path"] in TRACED_WEBSOCKETS)
+        )
+        if not traced:
+            await self.app(scope, receive, send)
+        elif self.replay_llm is not None:
+            await self._replay(scope, receive, send)
+        elif self.writer is None:
+            await self.app(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self._capture_websocket(scope, receive, send)
+        else:
+            await self._capture(scope, receive, send)
+
+    async def _replay(self, scope, receive, send):
+        trace_id = None
+        for key, value in scope.get("headers", []):
+            if key.decode("latin-1") == TRACE_ID_HEADER:
+                trace_id = value.decode("latin-1")
+                break
+        if trace_id is None:
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            trace_id = query.get(TRACE_ID_PARAM, [None])[0]
+        grouped: Dict[str, Deque[dict]] = defaultdict(deque)
+        for call in self.replay_llm.get(trace_id, []):
+            grouped[call["agent"]].append(call)
+        token = _replay_calls.set(grouped)
+        latency_token = _replay_latency.set(self.replay_latency_scale)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _replay_latency.reset(latency_token)
+            _replay_calls.reset(token)
+
+    async def _capture(self, scope, receive, send):
+        body_chunks: List[bytes] = []
+        status = {"code": 500}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                body_chunks.append(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        calls: list = []
+        token = _llm_calls.set(calls)
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            _llm_calls.reset(token)
+            record = {
+                "id": uuid4().hex,
+                "ts": round(started_at, 3),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "body": self._parse_body(b"".join(body_chunks)),
+                "status": status["code"],
+                "ms": _elapsed_ms(start),
+                "llm": list(calls),
+            }
+            self.writer.write(record)
+
+    async def _capture_websocket(self, scope, receive, send):
+        events: List[dict] = []
+        start = time.perf_counter()
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "websocket.receive" and message.get("text") is not None:
+                events.append({"t": _elapsed_ms(start), "in": self._parse_body(message["text"].encode("utf-8"))})
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "websocket.send" and message.get("text") is not None:
+                # Only what is needed to pair replies with requests; no scores or hint text
+                try:
+                    reply = json.loads(message["text"])
+                    out = {k: reply[k] for k in ("type", "for", "rev", "requestId") if k in reply}
+                except (ValueError, TypeError):
+                    out = {}
+                events.append({"t": _elapsed_ms(start), "out": out})
+            await send(message)
+
+        calls: list = []
+        token = _llm_calls.set(calls)
+        started_at = time.time()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            _llm_calls.reset(token)
+            self.writer.write({
+                "id": uuid4().hex,
+                "ts": round(started_at, 3),
+                "method": "WEBSOCKET",
+                "path": scope["path"],
+                "query": "",
+                "events": list(events),
+                "ms": _elapsed_ms(start),
+                "llm": list(calls),
+            })
+
+    def _parse_body(self, raw: bytes):
+        if not raw:
+            return None
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            return None
+        return _sanitize(body, self.max_field_chars, self.redact)
@@ -86,6 +86,26 @@ const ExpandableBadgeCriteria = ({ text }) => {
 
 let initializationPromise = null;
 
+// Smallest single splice that turns `prev` into `next` (shared prefix/suffix trimmed).
+// Works on code points so offsets match Python string indexing on the server.
+const textDelta = (prevText, nextText) => {
+  const prev = Array.from(prevText);
+  const next = Array.from(nextText);
+  let start = 0;
+  while (start < prev.length && start < next.length && prev[start] === next[start]) start++;
+  let end = 0;
+  while (
+    end < prev.length - start &&
+    end < next.length - start &&
+    prev[prev.length - 1 - end] === next[next.length - 1 - end]
+  ) end++;
+  return {
+    offset: start,
+    remove: prev.length - start - end,
+    insert: next.slice(start, next.length - end).join('')
+  };
+};
+
 const WritingApp = () => {
   const [writingType, setWritingType] = useState(null);
   const [submission, setSubmission] = useState('');
@@ -118,6 +138,117 @@ const WritingApp = () => {
 
   const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
+  // Game channel: the server holds writing type, badges and text; we only send deltas
+  const gameSocketRef = useRef(null);
+  const gameTextRef = useRef('');
+  const gameRevRef = useRef(0);
+  const pendingSubmitRef = useRef(null);
+  const pendingHintsRef = useRef(new Map());
+  const requestIdRef = useRef(0);
+  const latestSubmissionRef = useRef(submission);
+  latestSubmissionRef.current = submission;
+  const badgeKey = badges.map(b => b.id + b.name).join('|');
+
+  useEffect(() => {
+    if (!writingType || badges.length === 0) return;
+
+    const socket = new WebSocket(`${API_URL.replace(/^http/, 'ws').replace(/\/$/, '')}/ws/game`);
+    const rejectPending = (error) => {
+      if (pendingSubmitRef.current) {
+        pendingSubmitRef.current.reject(error);
+        pendingSubmitRef.current = null;
+      }
+      pendingHintsRef.current.forEach(({ reject }) => reject(error));
+      pendingHintsRef.current.clear();
+    };
+
+    socket.onopen = () => {
+      gameTextRef.current = latestSubmissionRef.current;
+      gameRevRef.current = 0;
+      socket.send(JSON.stringify({
+        type: 'start',
+        writingType,
+        badges: badges.map(({ id, name, criteria }) => ({ id, name, criteria })),
+        text: gameTextRef.current,
+        rev: 0
+      }));
+    };
+
+    const settle = (message, outcome, value) => {
+      const submit = pendingSubmitRef.current;
+      if (message.for === 'submit' || message.type === 'scores') {
+        if (submit && submit.requestId === message.requestId) {
+          submit[outcome](value);
+          pendingSubmitRef.current = null;
+        }
+      } else if (message.for === 'hint' || message.type === 'hint') {
+        const pending = pendingHintsRef.current.get(message.requestId);
+        if (pending) {
+          pending[outcome](value);
+          pendingHintsRef.current.delete(message.requestId);
+        }
+      }
+    };
+
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'scores') {
+        settle(message, 'resolve', message.result);
+      } else if (message.type === 'hint') {
+        settle(message, 'resolve', message.hint);
+      } else if (message.type === 'resync') {
+        gameRevRef.current += 1;
+        socket.send(JSON.stringify({ type: 'text', rev: gameRevRef.current, text: gameTextRef.current }));
+        if (message.for === 'submit') {
+          // The server had a different revision; score the text we just resent
+          socket.send(JSON.stringify({ type: 'submit', rev: gameRevRef.current, requestId: message.requestId }));
+        }
+      } else if (message.type === 'error') {
+        if (message.for === 'submit' || message.for === 'hint') {
+          settle(message, 'reject', new Error(message.message));
+        } else {
+          console.error('Game channel error:', message.message);
+        }
+      }
+    };
+
+    socket.onclose = () => {
+      rejectPending(new Error('Game channel closed'));
+      if (gameSocketRef.current === socket) gameSocketRef.current = null;
+    };
+
+    gameSocketRef.current = socket;
+    return () => {
+      gameSocketRef.current = null;
+      socket.close();
+    };
+  }, [writingType, badgeKey]);
+
+  useEffect(() => {
+    const socket = gameSocketRef.current;
+    if (!socket || socket.readyState !== WebSocket.OPEN || submission === gameTextRef.current) return;
+
+    const delta = textDelta(gameTextRef.current, submission);
+    gameTextRef.current = submission;
+    gameRevRef.current += 1;
+    socket.send(JSON.stringify({ type: 'delta', rev: gameRevRef.current, ...delta }));
+  }, [submission]);
+
+  const isGameChannelOpen = () =>
+    gameSocketRef.current && gameSocketRef.current.readyState === WebSocket.OPEN;
+
+  const submitOverGameChannel = () => new Promise((resolve, reject) => {
+    const requestId = ++requestIdRef.current;
+    pendingSubmitRef.current = { requestId, resolve, reject };
+    gameSocketRef.current.send(JSON.stringify({ type: 'submit', rev: gameRevRef.current, requestId }));
+  });
+
+  const hintOverGameChannel = (badgeIds) => new Promise((resolve, reject) => {
+    const requestId = ++requestIdRef.current;
+    pendingHintsRef.current.set(requestId, { resolve, reject });
+    gameSocketRef.current.send(JSON.stringify({ type: 'hint', requestId, badgeIds }));
+  });
+
   useEffect(() => {
     const initializeApp = async () => {
       try {
@@ -256,26 +387,31 @@ const WritingApp = () => {
     try {
       const hint = hints[index];
       
-      const response = await fetch(`${API_URL}/get-hint`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          submission: submission,
-          writingType: writingType,
-          badges: [
-            {
-              id: hint.targetBadge.id,
-              name: hint.targetBadge.name,
-              criteria: hint.targetBadge.criteria
-            }
-          ]
-        })
-      });
+      let newLine;
+      if (isGameChannelOpen()) {
+        newLine = await hintOverGameChannel([hint.targetBadge.id]);
+      } else {
+        const response = await fetch(`${API_URL}/get-hint`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify({
+            submission: submission,
+            writingType: writingType,
+            badges: [
+              {
+                id: hint.targetBadge.id,
+                name: hint.targetBadge.name,
+                criteria: hint.targetBadge.criteria
+              }
+            ]
+          })
+        });
 
-      const data = await response.json();
-      const newLine = data.hint;
+        const data = await response.json();
+        newLine = data.hint;
+      }
       
       setSubmission(prev => {
         const needsNewline = prev.trim().length > 0 && !prev.endsWith('\n');
@@ -298,24 +434,30 @@ const WritingApp = () => {
 
   const evaluateSubmission = async (text) => {
   try {
-    const response = await fetch(`${API_URL}/evaluate`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        submission: text,
-        writingType: writingType,
-        badges: badges.map(({ id, name, criteria }, index) => ({ 
-          id, 
-          name, 
-          criteria,
-          badge_number: index + 1
-        }))
-      })
-    });
-
-    const data = await response.json();
+    let data;
+    if (isGameChannelOpen() && text === gameTextRef.current) {
+      // The server already has the text, so the submit carries no payload
+      data = await submitOverGameChannel();
+    } else {
+      const response = await fetch(`${API_URL}/evaluate`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          submission: text,
+          writingType: writingType,
+          badges: badges.map(({ id, name, criteria }, index) => ({ 
+            id, 
+            name, 
+            criteria,
+            badge_number: index + 1
+          }))
+        })
+      });
+
+      data = await response.json();
+    }
 
     if (data.final_feedback) {
       setFeedback(data.final_feedback);